@@ -4,66 +4,136 @@ Nginx Log Watcher with Slack Alerting
 Monitors nginx access logs for failovers and error rates
 """
 
-import re
+import logging
+import queue
+import threading
 import time
 import os
-import json
-import subprocess
-from collections import deque
+import orjson
 from datetime import datetime
 import requests
-from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter, Retry
+from inotify_simple import INotify, flags
+from typing import Optional, Dict, Any, BinaryIO
+
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(message)s'
+)
+log = logging.getLogger(__name__)
+
+# pool/release values come from a tiny closed set ({"blue", "green", "-"} plus
+# the active release ids), so intern them once and the per-line comparisons
+# below collapse to pointer checks instead of character-by-character strcmp
+_FIELD_CACHE: Dict[str, str] = {}
+
+# The keys of interest, in the order they appear in the nginx log format
+_LOG_FIELDS = ('pool=', 'release=', 'upstream_status=', 'upstream_addr=')
+
+def build_parser():
+    """Generate a field extractor specialized to the fixed log format.
+
+    Because the field order is known up front, the generated function is a
+    flat run of find/slice operations - no loop, no per-token dispatch and
+    no match-object allocation. Each value spans up to the next known key,
+    which also handles comma-separated multi-upstream values like
+    "500, 502" without any reassembly.
+    """
+    src = ['def parse_fields(line):']
+    last = len(_LOG_FIELDS) - 1
+    for n, key in enumerate(_LOG_FIELDS):
+        if n == 0:
+            src.append(f"    i = line.find('{key}')")
+            src.append('    if i < 0: return None')
+            src.append(f'    i += {len(key)}')
+        else:
+            src.append(f"    j = line.find(' {key}', i)")
+            src.append('    if j < 0: return None')
+            src.append(f'    f{n - 1} = line[i:j]')
+            src.append(f'    i = j + {len(key) + 1}')
+    src.append(f'    f{last} = line[i:].strip()')
+    src.append('    return ' + ', '.join(f'f{n}' for n in range(len(_LOG_FIELDS))))
+    namespace: Dict[str, Any] = {}
+    exec(compile('\n'.join(src), '<generated parser>', 'exec'), namespace)
+    return namespace['parse_fields']
+
+parse_fields = build_parser()
 
 class LogWatcher:
-    def __init__(self):
-        self.slack_webhook = os.getenv('SLACK_WEBHOOK_URL', '')
-        self.error_threshold = float(os.getenv('ERROR_RATE_THRESHOLD', '2'))
-        self.window_size = int(os.getenv('WINDOW_SIZE', '200'))
-        self.cooldown_sec = int(os.getenv('ALERT_COOLDOWN_SEC', '300'))
-        self.maintenance_mode = os.getenv('MAINTENANCE_MODE', 'false').lower() == 'true'
+    def __init__(self) -> None:
+        self.slack_webhook: str = os.getenv('SLACK_WEBHOOK_URL', '')
+        self.error_threshold: float = float(os.getenv('ERROR_RATE_THRESHOLD', '2'))
+        self.window_size: int = int(os.getenv('WINDOW_SIZE', '200'))
+        self.cooldown_sec: int = int(os.getenv('ALERT_COOLDOWN_SEC', '300'))
+        self.maintenance_mode: bool = os.getenv('MAINTENANCE_MODE', 'false').lower() == 'true'
+        # error_count/window*100 > threshold, rearranged into integer space so
+        # the per-line check needs no float division
+        self.error_trigger: int = int(self.error_threshold * self.window_size)
 
         # State tracking
         self.current_pool: Optional[str] = None
-        self.request_window = deque(maxlen=self.window_size)
+        # Ring buffer of error flags (1 = 5xx) - only the >=500 predicate is
+        # ever consumed, so a byte per request beats a deque of status ints
+        self.window_buf: bytearray = bytearray(self.window_size)
+        self.window_pos: int = 0
+        self.window_filled: int = 0
+        self.error_count: int = 0
         self.last_alert_times: Dict[str, float] = {}
-        self.line_count = 0
-
-        # Log pattern
-        self.log_pattern = re.compile(
-            r'pool=(?P<pool>[\w\-]+)\s+'
-            r'release=(?P<release>[\w\-\.]+)\s+'
-            r'upstream_status=(?P<upstream_status>[\d,\s]+)\s+'  # Can be "502" or "500, 502"
-            r'upstream_addr=(?P<upstream_addr>[\w\.\:,\s]+)'      # Can be single or multiple
-        )
-
-        print(f"🔍 Log Watcher initialized")
-        print(f"   Error threshold: {self.error_threshold}%")
-        print(f"   Window size: {self.window_size} requests")
-        print(f"   Alert cooldown: {self.cooldown_sec}s")
-        print(f"   Maintenance mode: {self.maintenance_mode}")
-        print(f"   Slack webhook configured: {bool(self.slack_webhook)}")
+        self.line_count: int = 0
+        # Countdown for the periodic status diagnostics - decrement/compare
+        # beats an integer modulo on every line
+        self.status_countdown: int = 50
+        self.status_due: bool = False
+        # The error rate over the window moves slowly, so the threshold is
+        # only evaluated every few lines rather than on every request
+        self.err_check_countdown: int = 10
+
+        # Persistent session so repeat alerts reuse the TCP+TLS connection
+        # to Slack instead of paying a full handshake each time
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=2,
+            max_retries=Retry(total=2, backoff_factor=0.5)
+        ))
+
+        # Alerts are posted from a background worker so a slow Slack endpoint
+        # never stalls log ingestion
+        self.alert_q: queue.Queue = queue.Queue(maxsize=128)
+        threading.Thread(target=self.alert_worker, daemon=True).start()
+
+        log.info("🔍 Log Watcher initialized")
+        log.info("   Error threshold: %s%%", self.error_threshold)
+        log.info("   Window size: %s requests", self.window_size)
+        log.info("   Alert cooldown: %ss", self.cooldown_sec)
+        log.info("   Maintenance mode: %s", self.maintenance_mode)
+        log.info("   Slack webhook configured: %s", bool(self.slack_webhook))
         if self.slack_webhook:
-            print(f"   Webhook URL: {self.slack_webhook[:50]}...")
+            log.info("   Webhook URL: %s...", self.slack_webhook[:50])
 
-    def send_slack_alert(self, alert_type: str, message: str, details: Dict[str, Any]):
+    def send_slack_alert(self, alert_type: str, message: str, details: Dict[str, Any]) -> None:
         """Send alert to Slack with cooldown enforcement"""
-        print(f"\n🔔 Attempting to send {alert_type} alert...")
+        log.debug("🔔 Attempting to send %s alert...", alert_type)
 
         if not self.slack_webhook:
-            print(f"⚠️  Slack webhook not configured, skipping alert: {message}")
+            log.warning("⚠️  Slack webhook not configured, skipping alert: %s", message)
             return
 
         if self.maintenance_mode and alert_type != 'recovery':
-            print(f"🔧 Maintenance mode: suppressing {alert_type} alert")
+            log.info("🔧 Maintenance mode: suppressing %s alert", alert_type)
             return
 
         # Check cooldown
         now = time.time()
         last_alert = self.last_alert_times.get(alert_type, 0)
         if now - last_alert < self.cooldown_sec:
-            print(f"⏱️  Alert cooldown active for {alert_type}, skipping")
+            log.debug("⏱️  Alert cooldown active for %s, skipping", alert_type)
             return
 
+        # Only alerts that survive the gates above need a timestamp, so
+        # format it here rather than at every call site
+        details = {**details, "Timestamp": datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')}
+
         # Color coding
         colors = {
             'failover': '#FFA500',  # Orange
@@ -88,36 +158,64 @@ class LogWatcher:
             "icon_emoji": ":rotating_light:"
         }
 
-        print(f"   Payload: {json.dumps(payload, indent=2)[:200]}...")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("   Payload: %s...", orjson.dumps(payload)[:200].decode('utf-8', 'replace'))
 
+        # Hand off to the worker thread; never block the log loop. If the
+        # queue is full, drop the oldest alert to make room for the newest.
+        try:
+            self.alert_q.put_nowait((alert_type, payload))
+        except queue.Full:
+            try:
+                self.alert_q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.alert_q.put_nowait((alert_type, payload))
+            except queue.Full:
+                log.error("❌ Alert queue full, dropping %s alert", alert_type)
+                return
+
+        # Start the cooldown at enqueue time so a slow Slack endpoint can't
+        # let duplicate alerts pile up behind it
+        self.last_alert_times[alert_type] = now
+
+    def alert_worker(self) -> None:
+        """Background worker: posts queued alerts to Slack"""
+        while True:
+            alert_type, payload = self.alert_q.get()
+            self.post_alert(alert_type, payload)
+
+    def post_alert(self, alert_type: str, payload: Dict[str, Any]) -> None:
+        """Post a single alert payload to the Slack webhook"""
         try:
-            print(f"   Posting to: {self.slack_webhook[:50]}...")
-            response = requests.post(
+            log.debug("   Posting to: %s...", self.slack_webhook[:50])
+            response = self.session.post(
                 self.slack_webhook,
-                json=payload,
+                data=orjson.dumps(payload),
+                headers={'Content-Type': 'application/json'},
                 timeout=5
             )
-            print(f"   Response status: {response.status_code}")
-            print(f"   Response body: {response.text}")
+            log.debug("   Response status: %s", response.status_code)
+            log.debug("   Response body: %s", response.text)
 
             if response.status_code == 200:
-                print(f"✅ Slack alert sent: {alert_type}")
-                self.last_alert_times[alert_type] = now
+                log.info("✅ Slack alert sent: %s", alert_type)
             else:
-                print(f"❌ Slack alert failed: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"❌ Error sending Slack alert: {e}")
-            import traceback
-            traceback.print_exc()
+                log.error("❌ Slack alert failed: %s - %s", response.status_code, response.text)
+        except Exception:
+            log.exception("❌ Error sending Slack alert")
 
-    def check_failover(self, pool: str, release: str):
+    def check_failover(self, pool: str, release: str) -> None:
         """Detect pool changes (failover events)"""
         if self.current_pool is None:
             self.current_pool = pool
-            print(f"📍 Initial pool detected: {pool} ({release})")
+            log.info("📍 Initial pool detected: %s (%s)", pool, release)
             return
 
-        if pool != self.current_pool:
+        # Identity check first: pool strings are interned via _FIELD_CACHE,
+        # so the common no-change case never compares characters
+        if pool is not self.current_pool and pool != self.current_pool:
             old_pool = self.current_pool
             self.current_pool = pool
 
@@ -125,127 +223,170 @@ class LogWatcher:
             details = {
                 "Previous Pool": old_pool,
                 "Current Pool": pool,
-                "Release ID": release,
-                "Timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                "Release ID": release
             }
 
-            print(f"\n🔄 {message}")
-            print(f"   Details: {details}")
+            log.warning("🔄 %s", message)
+            log.info("   Details: %s", details)
             self.send_slack_alert('failover', message, details)
 
-    def check_error_rate(self):
+    def track_request(self, status: int) -> None:
+        """Record a request in the ring buffer, keeping error_count in sync"""
+        is_error = 1 if status >= 500 else 0
+        pos = self.window_pos
+        self.error_count += is_error - self.window_buf[pos]
+        self.window_buf[pos] = is_error
+        self.window_pos = (pos + 1) % self.window_size
+        if self.window_filled < self.window_size:
+            self.window_filled += 1
+
+    def check_error_rate(self) -> None:
         """Check if error rate exceeds threshold"""
-        if len(self.request_window) < self.window_size:
+        if self.window_filled < self.window_size:
             return  # Not enough data yet
 
-        error_count = sum(1 for status in self.request_window if status >= 500)
-        error_rate = (error_count / len(self.request_window)) * 100
+        error_count = self.error_count
 
         # Log error rate periodically
-        if self.line_count % 50 == 0:
-            print(f"   Current error rate: {error_rate:.2f}% ({error_count}/{len(self.request_window)})")
+        if self.status_due:
+            log.debug("   Current error rate: %.2f%% (%d/%d)",
+                      error_count * 100 / self.window_filled, error_count, self.window_filled)
 
-        if error_rate > self.error_threshold:
+        if error_count * 100 > self.error_trigger:
+            error_rate = (error_count / self.window_filled) * 100
             message = f"High error rate detected: {error_rate:.2f}%"
             details = {
                 "Error Rate": f"{error_rate:.2f}%",
                 "Threshold": f"{self.error_threshold}%",
                 "Window Size": self.window_size,
                 "5xx Count": error_count,
-                "Current Pool": self.current_pool or "unknown",
-                "Timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                "Current Pool": self.current_pool or "unknown"
             }
 
-            print(f"\n⚠️  {message}")
-            print(f"   Details: {details}")
+            log.warning("⚠️  %s", message)
+            log.info("   Details: %s", details)
             self.send_slack_alert('error_rate', message, details)
 
-    def process_log_line(self, line: str):
+    def process_log_line(self, line: str) -> None:
         """Parse and process a single log line"""
         self.line_count += 1
-
-        match = self.log_pattern.search(line)
-        if not match:
-            if self.line_count % 100 == 0:
-                print(f"   Processed {self.line_count} lines, no pattern match in recent line")
+        self.status_countdown -= 1
+        if self.status_countdown == 0:
+            self.status_countdown = 50
+            self.status_due = True
+        else:
+            self.status_due = False
+
+        fields = parse_fields(line)
+        if fields is None:
+            if self.status_due:
+                log.debug("   Processed %d lines, no pattern match in recent line", self.line_count)
             return
+        pool, release, upstream_status_raw, upstream_addr = fields
 
-        pool = match.group('pool')
-        release = match.group('release')
-        upstream_status_raw = match.group('upstream_status')
-        upstream_addr = match.group('upstream_addr')
+        pool = _FIELD_CACHE.setdefault(pool, pool)
+        release = _FIELD_CACHE.setdefault(release, release)
 
         # Parse status - could be "200" or "500, 500, 502"
-        # Take the LAST status (final result)
-        statuses = [int(s.strip()) for s in upstream_status_raw.split(',') if s.strip().isdigit()]
-        if not statuses:
+        # Only the LAST status (final result) matters, so grab the tail
+        # after the final comma instead of parsing every entry
+        i = upstream_status_raw.rfind(',')
+        tail = upstream_status_raw[i + 1:].strip() if i >= 0 else upstream_status_raw.strip()
+        if not tail.isdigit():
             return
-        upstream_status = statuses[-1]  # Use the last/final status
-
-        # Skip lines where pool/release are unavailable
-        if pool == '-' or release == '-':
-            # Still track errors for error rate calculation
-            self.request_window.append(upstream_status)
-            if self.line_count % 50 == 0:
-                print(f"   [{self.line_count}] No backend available, status={upstream_status}")
-            # Check error rate even without pool info
+        upstream_status = int(tail)
+
+        # Every request counts toward the error window, with or without
+        # backend info, so track and check on one linear path and layer the
+        # pool-specific handling on top
+        self.track_request(upstream_status)
+
+        if pool != '-' and release != '-':
+            if self.line_count <= 10 or self.status_due:
+                log.debug("   [%d] pool=%s status=%d addr=%s", self.line_count, pool, upstream_status, upstream_addr[:20])
+            self.check_failover(pool, release)
+        elif self.status_due:
+            log.debug("   [%d] No backend available, status=%d", self.line_count, upstream_status)
+
+        # An alert delayed by up to 10 lines at a 200-request window is
+        # operationally identical, so skip the threshold branch most lines
+        self.err_check_countdown -= 1
+        if self.err_check_countdown == 0:
+            self.err_check_countdown = 10
             self.check_error_rate()
-            return
-
-        # Log every request for debugging
-        if self.line_count <= 10 or self.line_count % 50 == 0:
-            print(f"   [{self.line_count}] pool={pool} status={upstream_status} addr={upstream_addr[:20]}")
-
-        # Track request in window
-        self.request_window.append(upstream_status)
-
-        # Check for failover
-        self.check_failover(pool, release)
 
-        # Check error rate
-        self.check_error_rate()
+    def drain_log(self, logfile: BinaryIO, leftover: bytes) -> bytes:
+        """Read a log file to EOF in large chunks, dispatching complete lines"""
+        # Draining in 64 KB chunks means a burst of log entries costs one
+        # read() instead of one per line
+        while True:
+            chunk = logfile.read(65536)
+            if not chunk:
+                return leftover  # Trailing partial line, if any
+            lines = (leftover + chunk).split(b'\n')
+            leftover = lines.pop()
+            for raw in lines:
+                # Fast-reject noise (health checks, partial writes) before
+                # paying for a decode and a full parse
+                if b'pool=' not in raw:
+                    continue
+                line = raw.decode('utf-8', 'replace').strip()
+                if line:
+                    self.process_log_line(line)
 
-    def tail_log(self, log_path: str):
-        """Tail nginx log file using tail -F command"""
-        print(f"📂 Waiting for log file: {log_path}")
+    def tail_log(self, log_path: str) -> None:
+        """Tail nginx log file directly, waking on inotify events"""
+        log.info("📂 Waiting for log file: %s", log_path)
 
         # Wait for log file to exist
         while not os.path.exists(log_path):
             time.sleep(1)
 
-        print(f"📖 Tailing log file: {log_path}")
+        log.info("📖 Tailing log file: %s", log_path)
+
+        # Follow the file in-process: seek to the end and let the kernel wake
+        # us on writes, watching the parent directory for rotations
+        log_dir = os.path.dirname(log_path) or '.'
+        log_name = os.path.basename(log_path)
 
-        # Use tail -F to follow the log file (works with rotations and symlinks)
-        process = subprocess.Popen(
-            ['tail', '-F', '-n', '0', log_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
+        inotify = INotify()
+        dir_wd = inotify.add_watch(log_dir, flags.CREATE | flags.MOVED_TO)
 
+        logfile = open(log_path, 'rb')
+        logfile.seek(0, os.SEEK_END)
+        inotify.add_watch(log_path, flags.MODIFY)
+
+        leftover = b''
         try:
-            if process.stdout is None:
-                raise RuntimeError("Failed to read from tail subprocess stdout")
-            for line in process.stdout:
-                line = line.strip()
-                if line:
-                    self.process_log_line(line)
+            while True:
+                leftover = self.drain_log(logfile, leftover)
+
+                rotated = False
+                for event in inotify.read():  # Blocks until activity
+                    if event.wd == dir_wd and event.name == log_name:
+                        rotated = True  # A new file took over our path
+                if rotated:
+                    # Flush anything left in the old file, then follow the new one
+                    leftover = self.drain_log(logfile, leftover)
+                    logfile.close()
+                    logfile = open(log_path, 'rb')
+                    inotify.add_watch(log_path, flags.MODIFY)
+                    log.info("🔁 Log rotated, reopened %s", log_path)
         except KeyboardInterrupt:
-            process.terminate()
+            logfile.close()
+            inotify.close()
             raise
 
-def main():
+def main() -> None:
     log_path = '/var/log/nginx/access.log'
     watcher = LogWatcher()
 
     try:
         watcher.tail_log(log_path)
     except KeyboardInterrupt:
-        print("\n👋 Shutting down gracefully...")
-    except Exception as e:
-        print(f"💥 Fatal error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.info("👋 Shutting down gracefully...")
+    except Exception:
+        log.exception("💥 Fatal error")
         raise
 
 if __name__ == '__main__':